@@ -35,23 +35,36 @@ class BLEListener:
         self.client = None
         self.target_address = None
         self.running = True
+        # Script paths already checked for the exec bit
+        self._prepared_scripts = set()
 
     async def scan_for_device(self):
-        """Scan for the target BLE device"""
+        """Scan for the target BLE device, stopping as soon as it appears"""
         logger.info(f"Scanning for device: {TARGET_DEVICE_NAME or 'Any device'}...")
-        
-        devices = await BleakScanner.discover(timeout=10.0)
-        
-        for device in devices:
+
+        found = asyncio.Event()
+        match = {}
+
+        def on_detection(device, advertisement_data):
             logger.debug(f"Found device: {device.name} ({device.address})")
-            
-            # Match by name if specified, otherwise accept first device with our service
+
+            # Match by name if specified, otherwise accept first device
             if TARGET_DEVICE_NAME is None or device.name == TARGET_DEVICE_NAME:
-                logger.info(f"Target device found: {device.name} ({device.address})")
-                return device.address
-        
-        logger.warning("Target device not found")
-        return None
+                match['name'] = device.name
+                match['address'] = device.address
+                found.set()
+
+        # Filtering in the detection callback ends the scan the instant
+        # the target advertises, instead of waiting the full timeout
+        async with BleakScanner(detection_callback=on_detection):
+            try:
+                await asyncio.wait_for(found.wait(), timeout=10.0)
+            except asyncio.TimeoutError:
+                logger.warning("Target device not found")
+                return None
+
+        logger.info(f"Target device found: {match['name']} ({match['address']})")
+        return match['address']
 
     def notification_handler(self, sender, data):
         """Handle notifications from the BLE characteristic"""
@@ -66,13 +79,14 @@ class BLEListener:
     def execute_action(self):
         """Execute the custom action script"""
         try:
-            if not os.path.exists(ACTION_SCRIPT):
-                logger.error(f"Action script not found: {ACTION_SCRIPT}")
-                return
-            
-            # Make script executable if it isn't
-            os.chmod(ACTION_SCRIPT, 0o755)
-            
+            # Make script executable if it isn't (checked once per path);
+            # a missing script surfaces as FileNotFoundError from the
+            # exec itself, so no separate existence stat is needed
+            if ACTION_SCRIPT not in self._prepared_scripts:
+                if not (os.stat(ACTION_SCRIPT).st_mode & 0o111):
+                    os.chmod(ACTION_SCRIPT, 0o755)
+                self._prepared_scripts.add(ACTION_SCRIPT)
+
             result = subprocess.run(
                 [ACTION_SCRIPT],
                 capture_output=True,
@@ -87,32 +101,40 @@ class BLEListener:
         
         except subprocess.TimeoutExpired:
             logger.error("Action script timed out")
+        except FileNotFoundError:
+            logger.error(f"Action script not found: {ACTION_SCRIPT}")
         except Exception as e:
             logger.error(f"Error executing action script: {e}")
 
     async def connect_and_listen(self, address):
         """Connect to device and listen for notifications"""
+        disconnected = asyncio.Event()
+
         try:
-            async with BleakClient(address) as client:
+            async with BleakClient(
+                address,
+                disconnected_callback=lambda _client: disconnected.set()
+            ) as client:
                 self.client = client
                 logger.info(f"Connected to {address}")
                 
-                # List available services
-                services = await client.get_services()
-                logger.info("Available services:")
-                for service in services:
-                    logger.info(f"  Service: {service.uuid}")
-                    for char in service.characteristics:
-                        logger.info(f"    Characteristic: {char.uuid} - Properties: {char.properties}")
+                # Service discovery is slow and purely diagnostic — only
+                # enumerate when debug logging is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    services = await client.get_services()
+                    logger.debug("Available services:")
+                    for service in services:
+                        logger.debug(f"  Service: {service.uuid}")
+                        for char in service.characteristics:
+                            logger.debug(f"    Characteristic: {char.uuid} - Properties: {char.properties}")
                 
                 # Subscribe to notifications
                 try:
                     await client.start_notify(CUSTOM_CHARACTERISTIC_UUID, self.notification_handler)
                     logger.info(f"Subscribed to notifications on {CUSTOM_CHARACTERISTIC_UUID}")
                     
-                    # Keep connection alive
-                    while self.running and client.is_connected:
-                        await asyncio.sleep(1)
+                    # Sleep until the peer disconnects — no periodic wakeups
+                    await disconnected.wait()
                 
                 except Exception as e:
                     logger.error(f"Error subscribing to characteristic: {e}")
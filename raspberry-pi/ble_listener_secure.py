@@ -5,9 +5,12 @@ Listens for authenticated BLE signals and executes actions
 """
 
 import asyncio
+import atexit
 import subprocess
 import logging
+import logging.handlers
 import json
+import queue
 import sys
 import os
 from bleak import BleakScanner, BleakClient
@@ -17,21 +20,58 @@ import time
 from pairing_manager import PairingManager
 from crypto_utils import CryptoUtils
 
+# Prefer orjson for parsing (C implementation, accepts bytes directly);
+# fall back to the stdlib json module when it isn't installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+    _JSONDecodeError = json.JSONDecodeError
+
 # Configuration
 BLE_SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
 BLE_CHARACTERISTIC_UUID = "12345678-1234-5678-1234-56789abcdef1"
 ACTION_SCRIPT = "/opt/BlueZscript/action_script.sh"
 SCAN_TIMEOUT = 10.0  # seconds
 RECONNECT_DELAY = 10  # seconds
+ACTION_QUEUE_SIZE = 8  # max pending actions before new triggers are dropped
+_REQUIRED_FIELDS = frozenset(('device_id', 'totp', 'timestamp', 'action'))
+MAX_CONCURRENT_ACTIONS = 2  # cap on simultaneously running action scripts
+DEBOUNCE_SECONDS = 1.0  # coalesce repeated triggers from the same device
+DEVICE_CACHE_TTL = 60  # seconds to cache paired-device lookups
+KNOWN_IDS_REFRESH = 60  # seconds between known-device-id set refreshes
+
+# Setup logging. Records go through a queue to a background thread so
+# the asyncio hot path never blocks on I/O, and file writes are batched
+# in memory (errors still flush immediately) to spare the SD card a
+# disk write per notification.
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+_file_handler = logging.FileHandler('/var/log/ble_listener_secure.log')
+_file_handler.setFormatter(_log_formatter)
+_buffered_file_handler = logging.handlers.MemoryHandler(
+    capacity=256,
+    flushLevel=logging.ERROR,
+    target=_file_handler
+)
+
+_stream_handler = logging.StreamHandler(sys.stdout)
+_stream_handler.setFormatter(_log_formatter)
+
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _buffered_file_handler, _stream_handler
+)
+_log_listener.start()
+# Drain the queue and flush buffered records at interpreter exit so the
+# tail of the log isn't lost on shutdown
+atexit.register(_log_listener.stop)
 
-# Setup logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/var/log/ble_listener_secure.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
 logger = logging.getLogger(__name__)
 
@@ -52,6 +92,33 @@ class SecureBLEListener:
         self.pairing_manager = PairingManager()
         self.running = True
         self.client: Optional[BleakClient] = None
+        # Base subprocess environment snapshot; each action overlays
+        # TRIGGER_DEVICE onto a per-call copy so concurrent actions
+        # don't race on a shared dict
+        self._action_env = os.environ.copy()
+        # Script paths already checked for the exec bit, so each trigger
+        # doesn't pay a chmod syscall
+        self._prepared_scripts = set()
+        # Bounded queue + semaphore so a notification flood can't
+        # fork-bomb the Pi with action subprocesses. Created in run():
+        # on Python 3.9 asyncio primitives bind the loop current at
+        # construction, and the listener is built before asyncio.run()
+        self._action_queue: Optional[asyncio.Queue] = None
+        self._action_sem: Optional[asyncio.Semaphore] = None
+        # Last accepted trigger per device (monotonic), for debouncing
+        self._last_trigger_ts: Dict[str, float] = {}
+        # Short-lived device lookup cache: device_id -> (expires, device)
+        self._device_cache: Dict[str, tuple] = {}
+        # Snapshot of paired device IDs for O(1) rejection of junk
+        # packets; marked stale so the first miss refreshes it
+        self._known_ids = frozenset(self.pairing_manager.list_device_ids())
+        self._known_ids_refreshed = float('-inf')
+        # Current epoch second, refreshed by a background task so the
+        # per-packet timestamp check avoids a time.time() call
+        self._now = int(time.time())
+        # Set by stop() to wake connection waits immediately; created in
+        # run() so it binds the running loop (see the queue note above)
+        self._stop_event: Optional[asyncio.Event] = None
         self.stats = {
             'total_attempts': 0,
             'successful_auth': 0,
@@ -77,79 +144,132 @@ class SecureBLEListener:
         Returns:
             Parsed message dict or None if invalid
         """
+        # Fast-reject frames that can't be a JSON object (0x7b == '{')
+        # without paying for a str decode or an exception
+        if not data or data[0] != 0x7b:
+            logger.warning("Invalid JSON in BLE message: %s", data)
+            return None
+
         try:
-            message_str = data.decode('utf-8')
-            message = json.loads(message_str)
-            
-            # Validate required fields
-            required_fields = ['device_id', 'totp', 'timestamp', 'action']
-            if not all(field in message for field in required_fields):
-                logger.warning(f"Missing required fields in message: {message.keys()}")
+            # Both parsers accept bytes and do their own UTF-8 decode in C
+            message = _json_loads(data)
+
+            # Validate required fields with one C-level subset check
+            if not _REQUIRED_FIELDS <= message.keys():
+                logger.warning("Missing required fields in message: %s", message.keys())
                 return None
-            
+
             return message
-        
-        except json.JSONDecodeError:
-            logger.warning(f"Invalid JSON in BLE message: {data}")
+
+        except _JSONDecodeError:
+            logger.warning("Invalid JSON in BLE message: %s", data)
             return None
         except UnicodeDecodeError:
-            logger.warning(f"Invalid UTF-8 in BLE message")
+            logger.warning("Invalid UTF-8 in BLE message")
             return None
         except Exception as e:
             logger.error(f"Error parsing message: {e}")
             return None
     
-    def validate_authentication(self, message: Dict) -> bool:
+    def _device_known(self, device_id: str) -> bool:
+        """
+        O(1) membership check against the known-device-id snapshot.
+
+        The snapshot is refreshed at most once per KNOWN_IDS_REFRESH
+        seconds on a miss, so an attacker flooding random device IDs
+        costs one set lookup per packet, not a database query.
+
+        Args:
+            device_id: Device identifier
+
+        Returns:
+            True if the device is (or has just become) paired
+        """
+        if device_id in self._known_ids:
+            return True
+
+        now = time.monotonic()
+        if now - self._known_ids_refreshed >= KNOWN_IDS_REFRESH:
+            self._known_ids = frozenset(self.pairing_manager.list_device_ids())
+            self._known_ids_refreshed = now
+            return device_id in self._known_ids
+
+        return False
+
+    def _lookup_device(self, device_id: str) -> Optional[Dict]:
+        """
+        Look up a paired device with a short-lived cache.
+
+        Avoids hitting the PairingManager (and its SQLite backend) on
+        every notification; unknown device IDs are cached too so an
+        attack flood doesn't turn into a database round-trip per packet.
+        Revocations made in another process (e.g. the web UI) take up to
+        DEVICE_CACHE_TTL seconds to be noticed here.
+
+        Args:
+            device_id: Device identifier
+
+        Returns:
+            Device dict (with decrypted secret) or None if not paired
+        """
+        now = time.monotonic()
+        cached = self._device_cache.get(device_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        device = self.pairing_manager.get_device(device_id)
+        self._device_cache[device_id] = (now + DEVICE_CACHE_TTL, device)
+        return device
+
+    def validate_authentication(self, message: Dict, device: Optional[Dict] = None) -> bool:
         """
         Validate BLE message authentication.
-        
+
         Multi-layer validation:
         1. Device is paired
         2. TOTP is valid
         3. Timestamp is fresh
-        
+
         Args:
             message: Parsed message dict
-            
+            device: Already-resolved device dict, to avoid re-querying
+                    when the caller has done the lookup
+
         Returns:
             True if authenticated, False otherwise
         """
         device_id = message['device_id']
         totp = message['totp']
         timestamp = message['timestamp']
-        
+
         self.stats['total_attempts'] += 1
-        
-        # Layer 1: Check if device is paired
-        if not self.pairing_manager.device_exists(device_id):
-            logger.warning(f"Authentication failed: Unknown device {device_id}")
-            self.stats['failed_auth'] += 1
-            return False
-        
-        # Get device details (including secret)
-        device = self.pairing_manager.get_device(device_id)
+
+        # Layer 1: Check if device is paired. The frozenset membership
+        # test rejects unknown IDs before any database work.
+        if device is None and self._device_known(device_id):
+            device = self._lookup_device(device_id)
         if not device:
-            logger.error(f"Device {device_id} exists but could not retrieve details")
+            logger.warning("Authentication failed: Unknown device %s", device_id)
             self.stats['failed_auth'] += 1
             return False
-        
+
         secret = device['secret_key']
         device_name = device['device_name']
         
         # Layer 2: Validate TOTP
         if not CryptoUtils.verify_totp(secret, totp):
-            logger.warning(f"Authentication failed: Invalid TOTP from {device_name} ({device_id})")
+            logger.warning("Authentication failed: Invalid TOTP from %s (%s)", device_name, device_id)
             self.stats['failed_auth'] += 1
             return False
         
         # Layer 3: Validate timestamp (replay protection)
-        if not CryptoUtils.validate_timestamp(timestamp):
-            logger.warning(f"Authentication failed: Stale timestamp from {device_name} ({device_id})")
+        if not CryptoUtils.validate_timestamp(timestamp, now=self._now):
+            logger.warning("Authentication failed: Stale timestamp from %s (%s)", device_name, device_id)
             self.stats['failed_auth'] += 1
             return False
         
         # All checks passed
-        logger.info(f"Authentication successful: {device_name} ({device_id})")
+        logger.info("Authentication successful: %s (%s)", device_name, device_id)
         self.stats['successful_auth'] += 1
         
         # Update last_used timestamp
@@ -157,26 +277,93 @@ class SecureBLEListener:
         
         return True
     
-    def execute_action(self, action: str, device_name: str):
+    def _prepare_action_script(self, action: str) -> bool:
         """
-        Execute the specified action.
-        
+        Validate the action and make sure the script is runnable.
+
+        Args:
+            action: Action to execute (currently only TRIGGER supported)
+
+        Returns:
+            True if the action script is ready to run, False otherwise
+        """
+        if action != "TRIGGER":
+            logger.warning(f"Unknown action requested: {action}")
+            return False
+
+        # Make script executable if it isn't (checked once per path);
+        # a missing script surfaces as FileNotFoundError from the exec
+        # itself, so no separate existence stat is needed
+        if ACTION_SCRIPT not in self._prepared_scripts:
+            try:
+                if not (os.stat(ACTION_SCRIPT).st_mode & 0o111):
+                    os.chmod(ACTION_SCRIPT, 0o755)
+            except FileNotFoundError:
+                logger.error(f"Action script not found: {ACTION_SCRIPT}")
+                return False
+            self._prepared_scripts.add(ACTION_SCRIPT)
+
+        return True
+
+    async def _execute_action_async(self, action: str, device_name: str):
+        """
+        Execute the specified action without blocking the event loop.
+
+        Runs the action script via an asyncio subprocess so incoming BLE
+        notifications keep being serviced while the script runs.
+
         Args:
             action: Action to execute (currently only TRIGGER supported)
             device_name: Name of device that triggered action
         """
         try:
-            if action != "TRIGGER":
-                logger.warning(f"Unknown action requested: {action}")
+            if not self._prepare_action_script(action):
                 return
-            
-            if not os.path.exists(ACTION_SCRIPT):
-                logger.error(f"Action script not found: {ACTION_SCRIPT}")
+
+            logger.info(f"Executing action '{action}' triggered by {device_name}")
+
+            # Per-call overlay: concurrent actions must not mutate the
+            # shared base env under each other
+            proc = await asyncio.create_subprocess_exec(
+                ACTION_SCRIPT,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env={**self._action_env, 'TRIGGER_DEVICE': device_name}
+            )
+
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=30)
+            except asyncio.TimeoutError:
+                proc.kill()
+                logger.error("Action script timed out (30s)")
                 return
-            
-            # Make script executable if it isn't
-            os.chmod(ACTION_SCRIPT, 0o755)
-            
+
+            if proc.returncode == 0:
+                logger.info(f"Action executed successfully: {stdout.decode().strip()}")
+                self.stats['actions_executed'] += 1
+            else:
+                logger.error(f"Action script failed: {stderr.decode().strip()}")
+
+        except FileNotFoundError:
+            logger.error(f"Action script not found: {ACTION_SCRIPT}")
+        except Exception as e:
+            logger.error(f"Error executing action: {e}")
+
+    def execute_action(self, action: str, device_name: str):
+        """
+        Execute the specified action synchronously.
+
+        Blocking variant kept for direct invocation; the notification
+        path uses _execute_action_async instead.
+
+        Args:
+            action: Action to execute (currently only TRIGGER supported)
+            device_name: Name of device that triggered action
+        """
+        try:
+            if not self._prepare_action_script(action):
+                return
+
             logger.info(f"Executing action '{action}' triggered by {device_name}")
             
             result = subprocess.run(
@@ -184,7 +371,7 @@ class SecureBLEListener:
                 capture_output=True,
                 text=True,
                 timeout=30,
-                env={**os.environ, 'TRIGGER_DEVICE': device_name}
+                env={**self._action_env, 'TRIGGER_DEVICE': device_name}
             )
             
             if result.returncode == 0:
@@ -195,6 +382,8 @@ class SecureBLEListener:
         
         except subprocess.TimeoutExpired:
             logger.error("Action script timed out (30s)")
+        except FileNotFoundError:
+            logger.error(f"Action script not found: {ACTION_SCRIPT}")
         except Exception as e:
             logger.error(f"Error executing action: {e}")
     
@@ -206,41 +395,95 @@ class SecureBLEListener:
             sender: BLE characteristic handle
             data: Raw notification data
         """
-        logger.debug(f"Received notification from {sender}: {len(data)} bytes")
+        logger.debug("Received notification from %s: %d bytes", sender, len(data))
         
         # Parse message
         message = self.parse_message(data)
         if not message:
             return
         
-        logger.info(f"Received message: action={message['action']}, device={message['device_id']}")
-        
+        logger.info("Received message: action=%s, device=%s", message['action'], message['device_id'])
+
+        # Resolve the device once and thread it through authentication
+        device_id = message['device_id']
+        device = self._lookup_device(device_id) if self._device_known(device_id) else None
+
         # Authenticate
-        if not self.validate_authentication(message):
+        if not self.validate_authentication(message, device):
             return
-        
+
+        # Debounce: drop repeat triggers within the coalescing window
+        now = time.monotonic()
+        if now - self._last_trigger_ts.get(device_id, 0.0) < DEBOUNCE_SECONDS:
+            logger.debug("Debounced repeat trigger from %s", device_id)
+            return
+        self._last_trigger_ts[device_id] = now
+
         # Get device name for logging
-        device = self.pairing_manager.get_device(message['device_id'])
         device_name = device['device_name'] if device else 'Unknown'
-        
-        # Execute action
-        self.execute_action(message['action'], device_name)
+
+        # Queue action for the worker; drop with a log under backpressure
+        if self._action_queue is None:
+            logger.warning("Action worker not running, dropping trigger from %s", device_name)
+            return
+        try:
+            self._action_queue.put_nowait((message['action'], device_name))
+        except asyncio.QueueFull:
+            logger.warning("Action queue full, dropping trigger from %s", device_name)
     
+    async def _clock_tick(self):
+        """
+        Refresh the cached epoch second once per second.
+
+        Keeps self._now fresh for timestamp validation without a
+        time.time() call on every packet.
+        """
+        while self.running:
+            self._now = int(time.time())
+            await asyncio.sleep(1)
+
+    async def _run_action(self, action: str, device_name: str):
+        """Run one queued action, then release its concurrency slot."""
+        try:
+            await self._execute_action_async(action, device_name)
+        finally:
+            self._action_sem.release()
+            self._action_queue.task_done()
+
+    async def _action_worker(self):
+        """
+        Drain the action queue, capping subprocess concurrency.
+
+        Runs for the lifetime of the listener. Each dequeued action is
+        spawned as its own task so up to MAX_CONCURRENT_ACTIONS scripts
+        can run at once; the semaphore is acquired before spawning so
+        the cap holds.
+        """
+        while self.running:
+            action, device_name = await self._action_queue.get()
+            await self._action_sem.acquire()
+            asyncio.create_task(self._run_action(action, device_name))
+
     async def scan_for_devices(self) -> list:
         """
-        Scan for BLE devices.
-        
+        Scan for BLE devices advertising our service UUID.
+
         Returns:
             List of discovered devices
         """
         logger.info("Scanning for BLE devices...")
-        
+
         try:
-            devices = await BleakScanner.discover(timeout=SCAN_TIMEOUT)
-            logger.info(f"Found {len(devices)} BLE devices")
+            # Filter by service UUID in the scan itself so we never
+            # attempt multi-second GATT connections to unrelated devices
+            devices = await BleakScanner.discover(
+                timeout=SCAN_TIMEOUT,
+                service_uuids=[BLE_SERVICE_UUID]
+            )
+            logger.info(f"Found {len(devices)} matching BLE devices")
             
             for device in devices:
-                logger.debug(f"  - {device.name or 'Unknown'} ({device.address})")
+                logger.debug("  - %s (%s)", device.name or 'Unknown', device.address)
             
             return devices
         
@@ -255,28 +498,45 @@ class SecureBLEListener:
         Args:
             address: BLE device address
         """
+        disconnected = asyncio.Event()
+
         try:
-            async with BleakClient(address, timeout=15.0) as client:
+            async with BleakClient(
+                address,
+                timeout=15.0,
+                disconnected_callback=lambda _client: disconnected.set()
+            ) as client:
                 self.client = client
-                logger.info(f"Connected to {address}")
-                
-                # List available services (for debugging)
-                services = await client.get_services()
-                logger.debug("Available services:")
-                for service in services:
-                    logger.debug(f"  Service: {service.uuid}")
-                    for char in service.characteristics:
-                        logger.debug(f"    Characteristic: {char.uuid} - {char.properties}")
-                
+                logger.info("Connected to %s", address)
+
+                # Service discovery is one of the slowest GATT operations
+                # and purely diagnostic here — only pay for it when debug
+                # logging is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    services = await client.get_services()
+                    logger.debug("Available services:")
+                    for service in services:
+                        logger.debug("  Service: %s", service.uuid)
+                        for char in service.characteristics:
+                            logger.debug("    Characteristic: %s - %s", char.uuid, char.properties)
+
                 # Subscribe to notifications
                 try:
                     await client.start_notify(BLE_CHARACTERISTIC_UUID, self.notification_handler)
-                    logger.info(f"Subscribed to notifications on {BLE_CHARACTERISTIC_UUID}")
-                    
-                    # Keep connection alive
-                    while self.running and client.is_connected:
-                        await asyncio.sleep(1)
-                
+                    logger.info("Subscribed to notifications on %s", BLE_CHARACTERISTIC_UUID)
+
+                    # Sleep until the peer disconnects or stop() is
+                    # called — no periodic wakeups
+                    waiters = [
+                        asyncio.create_task(disconnected.wait()),
+                        asyncio.create_task(self._stop_event.wait()),
+                    ]
+                    try:
+                        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        for waiter in waiters:
+                            waiter.cancel()
+
                 except Exception as e:
                     logger.error(f"Error subscribing to characteristic: {e}")
                     logger.info("Make sure the characteristic UUID is correct and supports notifications")
@@ -295,14 +555,27 @@ class SecureBLEListener:
         logger.info(f"BLE Service UUID: {BLE_SERVICE_UUID}")
         logger.info(f"BLE Characteristic UUID: {BLE_CHARACTERISTIC_UUID}")
         logger.info(f"Action script: {ACTION_SCRIPT}")
-        
+
+        # Create the asyncio primitives here so they bind the running
+        # loop (on Python 3.9 they bind whatever loop is current when
+        # constructed, which breaks when __init__ runs before
+        # asyncio.run())
+        self._action_queue = asyncio.Queue(maxsize=ACTION_QUEUE_SIZE)
+        self._action_sem = asyncio.Semaphore(MAX_CONCURRENT_ACTIONS)
+        self._stop_event = asyncio.Event()
+
+        # Background worker that executes queued actions, plus the
+        # once-per-second clock refresh
+        worker = asyncio.create_task(self._action_worker())
+        clock = asyncio.create_task(self._clock_tick())
+
         while self.running:
             try:
                 # Scan for devices
                 devices = await self.scan_for_devices()
                 
-                # Try to connect to first available device
-                # In production, you'd filter by service UUID
+                # Connect to discovered candidates (scan already filtered
+                # by our service UUID)
                 if devices:
                     for device in devices:
                         if self.running:
@@ -321,6 +594,9 @@ class SecureBLEListener:
                 logger.error(f"Unexpected error: {e}")
                 await asyncio.sleep(RECONNECT_DELAY)
         
+        worker.cancel()
+        clock.cancel()
+
         # Print final stats
         logger.info("=== Final Statistics ===")
         logger.info(f"Total auth attempts: {self.stats['total_attempts']}")
@@ -331,6 +607,8 @@ class SecureBLEListener:
     def stop(self):
         """Stop the listener."""
         self.running = False
+        if self._stop_event is not None:
+            self._stop_event.set()
         if self.client and self.client.is_connected:
             asyncio.create_task(self.client.disconnect())
 
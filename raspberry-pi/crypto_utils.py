@@ -4,13 +4,14 @@ Cryptographic Utilities for Secure BLE Authentication
 Provides TOTP generation/validation, HMAC signing, and secure key generation
 """
 
-import pyotp
 import hmac
 import hashlib
 import base64
 import secrets
+import struct
 import time
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
 
 # Configuration constants
 TOTP_INTERVAL = 30  # 30-second time step
@@ -18,6 +19,65 @@ TOTP_DIGITS = 6     # 6-digit codes
 TIMESTAMP_TOLERANCE = 300  # 5 minutes tolerance for replay protection
 
 
+@lru_cache(maxsize=256)
+def _decode_secret(secret: str) -> bytes:
+    """
+    Decode a base32 secret to raw key bytes, cached per secret.
+
+    The base32 decode is the expensive invariant part of every TOTP
+    operation, so it is memoized rather than re-run per call.
+
+    Args:
+        secret: Base32-encoded secret string
+
+    Returns:
+        bytes: Raw HMAC key bytes
+    """
+    # Re-pad in case the secret was stripped of trailing '='
+    padded = secret + '=' * (-len(secret) % 8)
+    return base64.b32decode(padded, casefold=True)
+
+
+@lru_cache(maxsize=256)
+def _base_hmac(key_bytes: bytes) -> 'hmac.HMAC':
+    """
+    Get a cached HMAC-SHA1 object with the key already absorbed.
+
+    HMAC setup hashes the key into the inner/outer pads on every call;
+    caching the keyed object and .copy()ing it per counter skips that
+    key schedule for all but the first verification of a device.
+
+    Args:
+        key_bytes: Raw HMAC key bytes
+
+    Returns:
+        hmac.HMAC: Keyed HMAC object to .copy() before updating
+    """
+    return hmac.new(key_bytes, None, hashlib.sha1)
+
+
+def _totp_at(key_bytes: bytes, counter: int) -> str:
+    """
+    Compute the RFC 6238 TOTP code for a key at a given time counter.
+
+    Implements HOTP-SHA1 with dynamic truncation directly via hmac +
+    struct, avoiding the per-call object churn of a full TOTP library.
+
+    Args:
+        key_bytes: Raw HMAC key bytes
+        counter: Time counter (unix time // TOTP_INTERVAL)
+
+    Returns:
+        str: Zero-padded TOTP code of TOTP_DIGITS digits
+    """
+    h = _base_hmac(key_bytes).copy()
+    h.update(struct.pack('>Q', counter))
+    digest = h.digest()
+    offset = digest[-1] & 0xf
+    code = (int.from_bytes(digest[offset:offset + 4], 'big') & 0x7fffffff) % (10 ** TOTP_DIGITS)
+    return str(code).zfill(TOTP_DIGITS)
+
+
 class CryptoUtils:
     """
     Cryptographic utilities for secure BLE authentication.
@@ -53,6 +113,50 @@ class CryptoUtils:
         secret = base64.b32encode(random_bytes).decode('utf-8')
         return secret
     
+    @staticmethod
+    def generate_secrets(n: int) -> List[str]:
+        """
+        Generate multiple secrets from a single RNG read.
+
+        One token_bytes call replaces n round trips to the OS RNG;
+        slices of the buffer are encoded individually.
+
+        Args:
+            n: Number of secrets to generate
+
+        Returns:
+            List[str]: n base32-encoded secret strings
+
+        Example:
+            >>> secrets_ = CryptoUtils.generate_secrets(3)
+            >>> len(secrets_)
+            3
+        """
+        buf = secrets.token_bytes(20 * n)
+        return [
+            base64.b32encode(buf[i * 20:(i + 1) * 20]).decode('utf-8')
+            for i in range(n)
+        ]
+
+    @staticmethod
+    def generate_device_ids(n: int) -> List[str]:
+        """
+        Generate multiple device IDs from a single RNG read.
+
+        Args:
+            n: Number of device IDs to generate
+
+        Returns:
+            List[str]: n 16-character hexadecimal device IDs
+
+        Example:
+            >>> ids = CryptoUtils.generate_device_ids(3)
+            >>> len(ids)
+            3
+        """
+        buf = secrets.token_bytes(8 * n)
+        return [buf[i * 8:(i + 1) * 8].hex() for i in range(n)]
+
     @staticmethod
     def generate_totp(secret: str) -> str:
         """
@@ -75,8 +179,8 @@ class CryptoUtils:
             >>> code.isdigit()
             True
         """
-        totp = pyotp.TOTP(secret, interval=TOTP_INTERVAL, digits=TOTP_DIGITS)
-        return totp.now()
+        counter = int(time.time()) // TOTP_INTERVAL
+        return _totp_at(_decode_secret(secret), counter)
     
     @staticmethod
     def verify_totp(secret: str, token: str, window: int = 1) -> bool:
@@ -102,9 +206,17 @@ class CryptoUtils:
             True
         """
         try:
-            totp = pyotp.TOTP(secret, interval=TOTP_INTERVAL, digits=TOTP_DIGITS)
-            # Verify with time window tolerance
-            return totp.verify(token, valid_window=window)
+            key_bytes = _decode_secret(secret)
+            token_bytes = token.encode('utf-8')
+            counter = int(time.time()) // TOTP_INTERVAL
+
+            # Check current counter plus adjacent windows for clock skew
+            for offset in range(-window, window + 1):
+                expected = _totp_at(key_bytes, counter + offset).encode('utf-8')
+                if hmac.compare_digest(expected, token_bytes):
+                    return True
+
+            return False
         except Exception:
             # Invalid secret format or other error
             return False
@@ -135,8 +247,8 @@ class CryptoUtils:
         key_bytes = secret.encode('utf-8')
         msg_bytes = message.encode('utf-8')
         
-        # Create HMAC-SHA256 signature
-        signature = hmac.new(key_bytes, msg_bytes, hashlib.sha256).digest()
+        # Create HMAC-SHA256 signature via the OpenSSL one-shot path
+        signature = hmac.digest(key_bytes, msg_bytes, 'sha256')
         
         # Return base64-encoded signature
         return base64.b64encode(signature).decode('utf-8')
@@ -164,29 +276,33 @@ class CryptoUtils:
             True
         """
         try:
-            # Generate expected signature
-            expected_signature = CryptoUtils.sign_message(secret, message)
-            
-            # Constant-time comparison to prevent timing attacks
-            return hmac.compare_digest(expected_signature, signature)
+            # One-shot HMAC, compared against the decoded signature in
+            # constant time — no base64 re-encode of the expected value
+            expected = hmac.digest(
+                secret.encode('utf-8'), message.encode('utf-8'), 'sha256'
+            )
+            return hmac.compare_digest(expected, base64.b64decode(signature))
         except Exception:
             return False
     
     @staticmethod
-    def validate_timestamp(timestamp: int, tolerance: int = TIMESTAMP_TOLERANCE) -> bool:
+    def validate_timestamp(timestamp: int, tolerance: int = TIMESTAMP_TOLERANCE,
+                           now: Optional[int] = None) -> bool:
         """
         Validate that a timestamp is recent.
-        
+
         Checks if the provided timestamp is within the tolerance window
         of the current time. Used to prevent replay attacks.
-        
+
         Args:
             timestamp: Unix timestamp (seconds since epoch)
             tolerance: Maximum age in seconds (default: 300 = 5 minutes)
-            
+            now: Current unix timestamp, for callers that already have
+                 one cached; defaults to time.time()
+
         Returns:
             bool: True if timestamp is fresh, False if too old or in future
-            
+
         Example:
             >>> import time
             >>> now = int(time.time())
@@ -195,9 +311,12 @@ class CryptoUtils:
             >>> CryptoUtils.validate_timestamp(now - 600)  # 10 minutes ago
             False
         """
-        current_time = int(time.time())
-        time_diff = abs(current_time - timestamp)
-        return time_diff <= tolerance
+        if now is None:
+            now = int(time.time())
+        # abs() measures faster than a chained range compare in CPython
+        # (one C call vs. two interpreter comparisons); the one-sided
+        # "branchless" form would wrongly accept future timestamps
+        return abs(now - timestamp) <= tolerance
     
     @staticmethod
     def generate_device_id() -> str:
@@ -4,12 +4,19 @@ Pairing Manager for Secure Device Storage
 Manages paired devices with encrypted secret storage using SQLite
 """
 
+import atexit
 import sqlite3
 import os
+import queue
 import stat
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Dict, List, Optional
 from datetime import datetime
+import base64
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import time
 import logging
 
@@ -19,6 +26,65 @@ logger = logging.getLogger(__name__)
 DEFAULT_DB_PATH = "/opt/BlueZscript/data/paired_devices.db"
 KEY_DIR = os.path.expanduser("~/.bluezscript")
 KEY_FILE = os.path.join(KEY_DIR, "master.key")
+READ_POOL_SIZE = 4  # read-only connections shared by reader threads
+DECRYPT_CACHE_SIZE = 1024  # decrypted secrets kept per manager
+LAST_USED_FLUSH_INTERVAL = 5.0  # seconds between coalesced last_used flushes
+
+# SQL hoisted to module scope so every call reuses the same interned
+# string and hits sqlite3's prepared-statement cache
+_SQL_INSERT_DEVICE = """
+    INSERT INTO paired_devices
+    (device_id, device_name, secret_key, paired_at, is_active)
+    VALUES (?, ?, ?, ?, 1)
+"""
+_SQL_GET_DEVICE = """
+    SELECT * FROM paired_devices
+    WHERE device_id = ? AND is_active = 1
+"""
+_SQL_LIST_DEVICES = """
+    SELECT id, device_id, device_name, paired_at, last_used
+    FROM paired_devices
+    WHERE is_active = 1
+    ORDER BY paired_at DESC
+"""
+_SQL_LIST_DEVICE_IDS = """
+    SELECT device_id FROM paired_devices
+    WHERE is_active = 1
+"""
+_SQL_REMOVE_DEVICE = """
+    UPDATE paired_devices
+    SET is_active = 0
+    WHERE device_id = ? AND is_active = 1
+"""
+_SQL_UPDATE_LAST_USED = """
+    UPDATE paired_devices
+    SET last_used = ?
+    WHERE device_id = ? AND is_active = 1
+"""
+_SQL_DEVICE_EXISTS = """
+    SELECT 1 FROM paired_devices
+    WHERE device_id = ? AND is_active = 1
+    LIMIT 1
+"""
+_SQL_DEVICE_COUNT = """
+    SELECT COUNT(*) FROM paired_devices
+    WHERE is_active = 1
+"""
+_SQL_ACTIVE_COUNTS = """
+    SELECT COUNT(*),
+           COALESCE(SUM(CASE WHEN last_used > ? THEN 1 ELSE 0 END), 0)
+    FROM paired_devices
+    WHERE is_active = 1
+"""
+_SQL_HARD_DELETE_DEVICE = """
+    DELETE FROM paired_devices
+    WHERE device_id = ?
+"""
+
+# Ciphers built from the master key, shared across manager instances so
+# repeated construction (several services, test suites) reads the key
+# file and sets up the AEAD exactly once per process
+_cipher_cache: Dict[str, tuple] = {}
 
 
 class PairingManager:
@@ -27,7 +93,8 @@ class PairingManager:
     
     Features:
     - SQLite database for persistent storage
-    - Fernet symmetric encryption for secrets at rest
+    - AES-GCM encryption for secrets at rest (legacy Fernet rows
+      are still readable)
     - Soft delete for audit trail
     - Automatic key generation and management
     """
@@ -45,27 +112,102 @@ class PairingManager:
             0
         """
         self.db_path = db_path
-        
+        # URI paths (file:...?mode=memory&cache=shared etc.) skip the
+        # filesystem-only handling below
+        self._is_uri = db_path.startswith('file:')
+        self._is_memory = ':memory:' in db_path or 'mode=memory' in db_path
+
         # Ensure database directory exists
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        if not self._is_uri:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
         # Load or generate encryption key
         self.cipher = self._load_or_generate_key()
-        
-        # Initialize database
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        # LRU of decrypted secrets keyed by ciphertext, so repeat
+        # get_device calls skip the AEAD work entirely
+        self._dec_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._aead_decrypt = self.cipher.decrypt
+        
+        # Initialize database. self.conn is the single writer; all
+        # writes funnel through it under a lock, while reads go to a
+        # pool of read-only connections so they never contend with a
+        # writer (or each other) on the connection mutex.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False,
+                                    cached_statements=256, uri=self._is_uri)
         self.conn.row_factory = sqlite3.Row  # Enable column access by name
+        self._write_lock = threading.Lock()
         self._init_db()
-        
+
+        # Note: the pool only applies to plain filesystem paths; with a
+        # file: URI (memory or otherwise) reads share the writer under
+        # its lock, since appending mode=ro to an arbitrary URI's query
+        # string isn't reliable.
+        self._read_pool: queue.Queue = queue.Queue()
+        self._read_pool_size = 0
+        if not self._is_memory and not self._is_uri:
+            for _ in range(READ_POOL_SIZE):
+                read_conn = sqlite3.connect(
+                    f"file:{db_path}?mode=ro", uri=True, check_same_thread=False,
+                    cached_statements=256
+                )
+                read_conn.row_factory = sqlite3.Row
+                self._read_pool.put(read_conn)
+                self._read_pool_size += 1
+
+        # Coalesced last_used updates: the newest timestamp per device
+        # is kept in memory and flushed in one transaction every few
+        # seconds, keeping fsyncs off the authentication critical path
+        self._pending_last_used: Dict[str, int] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self._flush_last_used)
+
         # Set secure permissions on database
-        self._set_secure_permissions(db_path)
-        
+        if not self._is_uri:
+            self._set_secure_permissions(db_path)
+
         logger.info(f"PairingManager initialized with database: {db_path}")
+
+    @contextmanager
+    def _read(self):
+        """Borrow a read-only connection from the pool.
+
+        Falls back to the writer connection (under its lock) for
+        in-memory databases, which can't be opened read-only.
+        """
+        if self._read_pool_size == 0:
+            with self._write_lock:
+                yield self.conn
+            return
+
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+
+    @contextmanager
+    def _write(self):
+        """Serialize access to the single writer connection."""
+        with self._write_lock:
+            yield self.conn
     
     def _init_db(self):
         """Create database schema if it doesn't exist."""
         cursor = self.conn.cursor()
-        
+
+        # Tune SQLite before touching the schema: WAL gives concurrent
+        # readers and roughly one fsync per commit instead of two, and
+        # synchronous=NORMAL is safe in WAL mode. In-memory databases
+        # don't support WAL, so skip it there.
+        if not self._is_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")
+        cursor.execute("PRAGMA foreign_keys=ON")
+
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS paired_devices (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -78,30 +220,49 @@ class PairingManager:
             )
         """)
         
-        # Create index for faster lookups
+        # Covering index so existence checks are a single index seek;
+        # supersedes the old single-column idx_device_id
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_device_id 
-            ON paired_devices(device_id)
+            CREATE INDEX IF NOT EXISTS idx_device_active
+            ON paired_devices(device_id, is_active)
         """)
-        
+        cursor.execute("DROP INDEX IF EXISTS idx_device_id")
+
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_active 
+            CREATE INDEX IF NOT EXISTS idx_active
             ON paired_devices(is_active)
         """)
+
+        # Lets the recently-used aggregate run as an index range scan
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_active_lastused
+            ON paired_devices(is_active, last_used)
+        """)
         
         self.conn.commit()
         logger.debug("Database schema initialized")
     
-    def _load_or_generate_key(self) -> Fernet:
+    def _load_or_generate_key(self) -> AESGCM:
         """
         Load existing master key or generate new one.
-        
+
+        The key file stores a urlsafe-base64 32-byte key (the same
+        format Fernet used), so existing installs keep their key; the
+        decoded bytes drive an AES-GCM cipher, which skips Fernet's
+        separate HMAC pass and PKCS7 padding per call. A Fernet
+        instance on the same key is kept for decrypting legacy rows.
+
         Returns:
-            Fernet: Cipher instance for encryption/decryption
+            AESGCM: Cipher instance for encryption/decryption
         """
+        cached = _cipher_cache.get(KEY_FILE)
+        if cached is not None:
+            aead, self._legacy_cipher = cached
+            return aead
+
         # Create key directory if it doesn't exist
         os.makedirs(KEY_DIR, exist_ok=True)
-        
+
         if os.path.exists(KEY_FILE):
             # Load existing key
             with open(KEY_FILE, 'rb') as f:
@@ -110,16 +271,19 @@ class PairingManager:
         else:
             # Generate new key
             key = Fernet.generate_key()
-            
+
             # Save key with secure permissions
             with open(KEY_FILE, 'wb') as f:
                 f.write(key)
-            
+
             # Set file permissions to 600 (owner read/write only)
             self._set_secure_permissions(KEY_FILE)
             logger.info(f"Generated new master key: {KEY_FILE}")
-        
-        return Fernet(key)
+
+        self._legacy_cipher = Fernet(key)
+        aead = AESGCM(base64.urlsafe_b64decode(key))
+        _cipher_cache[KEY_FILE] = (aead, self._legacy_cipher)
+        return aead
     
     def _set_secure_permissions(self, filepath: str):
         """Set file permissions to 600 (owner read/write only)."""
@@ -135,12 +299,13 @@ class PairingManager:
         
         Args:
             secret: Plain text secret
-            
+
         Returns:
-            str: Encrypted secret (base64 encoded)
+            str: Encrypted secret (base64-encoded nonce || ciphertext)
         """
-        encrypted = self.cipher.encrypt(secret.encode('utf-8'))
-        return encrypted.decode('utf-8')
+        nonce = os.urandom(12)
+        ciphertext = self.cipher.encrypt(nonce, secret.encode('utf-8'), None)
+        return base64.b64encode(nonce + ciphertext).decode('utf-8')
     
     def _decrypt_secret(self, encrypted: str) -> str:
         """
@@ -152,8 +317,22 @@ class PairingManager:
         Returns:
             str: Plain text secret
         """
-        decrypted = self.cipher.decrypt(encrypted.encode('utf-8'))
-        return decrypted.decode('utf-8')
+        cached = self._dec_cache.get(encrypted)
+        if cached is not None:
+            self._dec_cache.move_to_end(encrypted)
+            return cached
+
+        try:
+            raw = base64.b64decode(encrypted.encode('utf-8'))
+            decrypted = self._aead_decrypt(raw[:12], raw[12:], None).decode('utf-8')
+        except Exception:
+            # Rows written before the AES-GCM switch are Fernet tokens
+            decrypted = self._legacy_cipher.decrypt(encrypted.encode('utf-8')).decode('utf-8')
+
+        self._dec_cache[encrypted] = decrypted
+        if len(self._dec_cache) > DECRYPT_CACHE_SIZE:
+            self._dec_cache.popitem(last=False)
+        return decrypted
     
     def add_device(self, device_id: str, device_name: str, secret_key: str) -> bool:
         """
@@ -172,23 +351,46 @@ class PairingManager:
             >>> manager.add_device("abc123", "My Phone", "JBSWY3DPEHPK3PXP")
             True
         """
+        return self.add_devices([(device_id, device_name, secret_key)])
+
+    def add_devices(self, devices: List[tuple]) -> bool:
+        """
+        Add multiple paired devices in a single transaction.
+
+        Batching means one commit (and one fsync) for the whole list
+        instead of one per device.
+
+        Args:
+            devices: List of (device_id, device_name, secret_key) tuples
+
+        Returns:
+            bool: True if all devices were added, False otherwise
+
+        Example:
+            >>> manager.add_devices([("abc123", "My Phone", "JBSWY3DPEHPK3PXP")])
+            True
+        """
         try:
-            # Encrypt secret before storage
-            encrypted_secret = self._encrypt_secret(secret_key)
-            
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT INTO paired_devices 
-                (device_id, device_name, secret_key, paired_at, is_active)
-                VALUES (?, ?, ?, ?, 1)
-            """, (device_id, device_name, encrypted_secret, int(time.time())))
-            
-            self.conn.commit()
-            logger.info(f"Added device: {device_id} ({device_name})")
+            now = int(time.time())
+            # Encrypt secrets before storage
+            rows = [
+                (device_id, device_name, self._encrypt_secret(secret_key), now)
+                for device_id, device_name, secret_key in devices
+            ]
+
+            with self._write() as conn:
+                # The connection context manager commits on success and
+                # rolls the whole batch back on failure, so a mid-batch
+                # IntegrityError leaves no partial rows behind
+                with conn:
+                    conn.executemany(_SQL_INSERT_DEVICE, rows)
+
+            for device_id, device_name, _secret, _paired_at in rows:
+                logger.info(f"Added device: {device_id} ({device_name})")
             return True
-        
+
         except sqlite3.IntegrityError:
-            logger.warning(f"Device already exists: {device_id}")
+            logger.warning(f"Device already exists: {', '.join(d[0] for d in devices)}")
             return False
         except Exception as e:
             logger.error(f"Error adding device: {e}")
@@ -210,18 +412,18 @@ class PairingManager:
             'My Phone'
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT * FROM paired_devices 
-                WHERE device_id = ? AND is_active = 1
-            """, (device_id,))
-            
-            row = cursor.fetchone()
+            with self._read() as conn:
+                row = conn.execute(_SQL_GET_DEVICE, (device_id,)).fetchone()
             
             if row:
                 device = dict(row)
                 # Decrypt secret
                 device['secret_key'] = self._decrypt_secret(device['secret_key'])
+                # Overlay any last_used update that hasn't flushed yet
+                pending = self._pending_last_used.get(device_id)
+                if pending is not None and (device['last_used'] is None
+                                            or pending > device['last_used']):
+                    device['last_used'] = pending
                 return device
             
             return None
@@ -243,21 +445,38 @@ class PairingManager:
             3
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT id, device_id, device_name, paired_at, last_used
-                FROM paired_devices 
-                WHERE is_active = 1
-                ORDER BY paired_at DESC
-            """)
-            
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            # Iterate the cursor directly: rows stream from SQLite in
+            # chunks instead of being materialized twice via fetchall()
+            with self._read() as conn:
+                return [dict(row) for row in conn.execute(_SQL_LIST_DEVICES)]
         
         except Exception as e:
             logger.error(f"Error listing devices: {e}")
             return []
     
+    def list_device_ids(self) -> List[str]:
+        """
+        List IDs of all active paired devices.
+
+        Cheaper than list_devices() when only the identifiers are needed
+        (e.g. for membership checks).
+
+        Returns:
+            List of device_id strings
+
+        Example:
+            >>> ids = manager.list_device_ids()
+            >>> "abc123" in ids
+            True
+        """
+        try:
+            with self._read() as conn:
+                return [row[0] for row in conn.execute(_SQL_LIST_DEVICE_IDS)]
+
+        except Exception as e:
+            logger.error(f"Error listing device ids: {e}")
+            return []
+
     def remove_device(self, device_id: str) -> bool:
         """
         Soft delete a device (maintains audit trail).
@@ -273,16 +492,13 @@ class PairingManager:
             True
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                UPDATE paired_devices 
-                SET is_active = 0 
-                WHERE device_id = ?
-            """, (device_id,))
-            
-            self.conn.commit()
-            
+            with self._write() as conn:
+                cursor = conn.execute(_SQL_REMOVE_DEVICE, (device_id,))
+                conn.commit()
+
             if cursor.rowcount > 0:
+                # Drop any cached plaintext for removed rows
+                self._dec_cache.clear()
                 logger.info(f"Removed device: {device_id}")
                 return True
             else:
@@ -308,19 +524,46 @@ class PairingManager:
             True
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                UPDATE paired_devices 
-                SET last_used = ? 
-                WHERE device_id = ? AND is_active = 1
-            """, (int(time.time()), device_id))
-            
-            self.conn.commit()
-            return cursor.rowcount > 0
-        
+            if not self.device_exists(device_id):
+                return False
+
+            # Record in memory only; the flush timer batches the actual
+            # write so each authentication doesn't pay an fsync
+            with self._pending_lock:
+                self._pending_last_used[device_id] = int(time.time())
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(
+                        LAST_USED_FLUSH_INTERVAL, self._flush_last_used
+                    )
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+            return True
+
         except Exception as e:
             logger.error(f"Error updating last_used: {e}")
             return False
+
+    def _flush_last_used(self):
+        """Write all coalesced last_used updates in one transaction."""
+        with self._pending_lock:
+            items = [(ts, device_id)
+                     for device_id, ts in self._pending_last_used.items()]
+            self._pending_last_used.clear()
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+        if not items:
+            return
+
+        try:
+            with self._write() as conn:
+                conn.executemany(_SQL_UPDATE_LAST_USED, items)
+                conn.commit()
+            logger.debug(f"Flushed {len(items)} last_used update(s)")
+
+        except Exception as e:
+            logger.error(f"Error flushing last_used updates: {e}")
     
     def device_exists(self, device_id: str) -> bool:
         """
@@ -337,14 +580,9 @@ class PairingManager:
             True
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM paired_devices 
-                WHERE device_id = ? AND is_active = 1
-            """, (device_id,))
-            
-            count = cursor.fetchone()[0]
-            return count > 0
+            with self._read() as conn:
+                row = conn.execute(_SQL_DEVICE_EXISTS, (device_id,)).fetchone()
+            return row is not None
         
         except Exception as e:
             logger.error(f"Error checking device existence: {e}")
@@ -362,18 +600,37 @@ class PairingManager:
             5
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM paired_devices 
-                WHERE is_active = 1
-            """)
-            
-            return cursor.fetchone()[0]
+            with self._read() as conn:
+                return conn.execute(_SQL_DEVICE_COUNT).fetchone()[0]
         
         except Exception as e:
             logger.error(f"Error getting device count: {e}")
             return 0
     
+    def get_active_counts(self, recent_seconds: int = 86400) -> tuple:
+        """
+        Get total and recently-used active device counts in one query.
+
+        Args:
+            recent_seconds: Window for the "recently used" count
+                            (default: 86400 = 24 hours)
+
+        Returns:
+            tuple: (total_active, active_within_window)
+
+        Example:
+            >>> total, active_24h = manager.get_active_counts()
+        """
+        try:
+            threshold = int(time.time()) - recent_seconds
+            with self._read() as conn:
+                row = conn.execute(_SQL_ACTIVE_COUNTS, (threshold,)).fetchone()
+            return (row[0], row[1])
+
+        except Exception as e:
+            logger.error(f"Error getting active counts: {e}")
+            return (0, 0)
+
     def hard_delete_device(self, device_id: str) -> bool:
         """
         Permanently delete a device from database.
@@ -387,15 +644,13 @@ class PairingManager:
             bool: True if deleted successfully
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                DELETE FROM paired_devices 
-                WHERE device_id = ?
-            """, (device_id,))
-            
-            self.conn.commit()
-            
+            with self._write() as conn:
+                cursor = conn.execute(_SQL_HARD_DELETE_DEVICE, (device_id,))
+                conn.commit()
+
             if cursor.rowcount > 0:
+                # Drop any cached plaintext for deleted rows
+                self._dec_cache.clear()
                 logger.info(f"Hard deleted device: {device_id}")
                 return True
             else:
@@ -406,7 +661,15 @@ class PairingManager:
             return False
     
     def close(self):
-        """Close database connection."""
+        """Flush pending writes and close all database connections."""
+        self._flush_last_used()
+        # Don't keep closed managers alive until interpreter exit
+        atexit.unregister(self._flush_last_used)
+
+        while self._read_pool_size > 0:
+            self._read_pool.get().close()
+            self._read_pool_size -= 1
+
         if self.conn:
             self.conn.close()
             logger.info("Database connection closed")
@@ -4,13 +4,31 @@ Flask Web UI for BlueZscript Pairing Management
 Provides web interface for device pairing and management
 """
 
-from flask import Flask, render_template, jsonify, request, send_file
-import qrcode
+from flask import Flask, Response, render_template, jsonify, request
+
+# segno writes QR PNGs directly without routing through PIL and is
+# substantially faster; fall back to qrcode+PIL when it isn't installed
+try:
+    import segno
+    qrcode = None
+except ImportError:
+    segno = None
+    import qrcode
+
+# orjson encodes the device-list dicts ~2-3x faster than stdlib json;
+# responses fall back to Flask's default provider when it's missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import io
 import json
 import logging
-from datetime import datetime
-from functools import wraps
+import threading
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from typing import Dict
 import time
 
 from pairing_manager import PairingManager
@@ -22,47 +40,185 @@ logger = logging.getLogger(__name__)
 HOST = '0.0.0.0'  # Listen on all interfaces
 PORT = 5000
 DEBUG = False
-
-# Rate limiting (simple in-memory)
-pairing_requests = {}  # IP -> last request time
+# Worker threads for the WSGI server; PairingManager's read pool
+# (READ_POOL_SIZE) should be sized to roughly match
+WSGI_THREADS = 8
+
+# Rate limiting (simple in-memory, LRU-ordered and bounded).
+# Monotonic timestamps so NTP adjustments can't bypass or extend limits.
+pairing_requests: "OrderedDict[str, float]" = OrderedDict()  # IP -> last request
+pairing_requests_lock = threading.Lock()
 RATE_LIMIT_SECONDS = 60  # 1 pairing request per minute per IP
+RATE_LIMIT_MAX_ENTRIES = 1024  # cap memory under spoofed-IP floods
+
+# Pre-rendered QR PNGs keyed by (device_id, secret). The payload is
+# deterministic, so rendering once at pairing time turns /api/qr/<id>
+# into a plain cached-bytes response.
+_qr_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_qr_cache_lock = threading.Lock()
+QR_CACHE_MAX_ENTRIES = 256
+QR_CACHE_MAX_AGE = 3600  # browser cache lifetime, seconds
+
+# Pairing payloads serialized once in pair_new and reused by
+# /api/qr/<id>: device_id -> (payload_json, secret, expiry)
+_pending_pair: Dict[str, tuple] = {}
+_pending_pair_lock = threading.Lock()
+PENDING_PAIR_TTL = 300  # seconds a pending pairing payload is kept
+
+# Per-thread scratch buffer reused across QR renders
+_tls = threading.local()
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = CryptoUtils.generate_secret()  # For session security
 
+if orjson is not None:
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """JSON provider backed by orjson for faster response encoding."""
+
+        def dumps(self, obj, **kwargs) -> str:
+            return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+
 # Initialize pairing manager
 pairing_manager = PairingManager()
 
 
+@lru_cache(maxsize=1024)
+def _format_ts(ts: int) -> str:
+    """Format a unix timestamp for display, memoized per timestamp.
+
+    paired_at never changes after insert and last_used changes rarely,
+    so repeat page loads skip the strftime entirely. time.strftime on a
+    struct_time also avoids the datetime object allocation.
+    """
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+
+
+def _render_qr_png(payload: str) -> bytes:
+    """Render a pairing payload to PNG bytes.
+
+    Reuses a thread-local BytesIO as scratch space; the returned bytes
+    are a copy, so reuse across renders is safe.
+    """
+    buf = getattr(_tls, 'qr_buf', None)
+    if buf is None:
+        buf = _tls.qr_buf = io.BytesIO()
+    buf.seek(0)
+    buf.truncate(0)
+
+    if segno is not None:
+        segno.make(payload, error='l').save(buf, kind='png', scale=10, border=4)
+        return buf.getvalue()
+
+    # qrcode+PIL fallback
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _get_qr_png(device_id: str, secret: str, payload: str) -> bytes:
+    """Get the QR PNG for a pairing, rendering and caching on miss."""
+    key = (device_id, secret)
+
+    with _qr_cache_lock:
+        cached = _qr_cache.get(key)
+        if cached is not None:
+            _qr_cache.move_to_end(key)
+            return cached
+
+    png = _render_qr_png(payload)
+
+    with _qr_cache_lock:
+        _qr_cache[key] = png
+        while len(_qr_cache) > QR_CACHE_MAX_ENTRIES:
+            _qr_cache.popitem(last=False)
+
+    return png
+
+
+def _stash_pending_pair(device_id: str, payload: str, secret: str):
+    """Remember a serialized pairing payload for the QR endpoint."""
+    now = time.monotonic()
+    with _pending_pair_lock:
+        # Drop expired entries on each access
+        expired = [k for k, entry in _pending_pair.items() if entry[2] <= now]
+        for k in expired:
+            del _pending_pair[k]
+        _pending_pair[device_id] = (payload, secret, now + PENDING_PAIR_TTL)
+
+
+def _get_pending_pair(device_id: str):
+    """Fetch a stored pairing payload, or None if absent/expired."""
+    with _pending_pair_lock:
+        entry = _pending_pair.get(device_id)
+        if entry is None or entry[2] <= time.monotonic():
+            return None
+        return entry
+
+
 def rate_limit(f):
     """Decorator for rate limiting pairing requests."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         client_ip = request.remote_addr
-        current_time = time.time()
-        
-        if client_ip in pairing_requests:
-            last_request = pairing_requests[client_ip]
-            if current_time - last_request < RATE_LIMIT_SECONDS:
+        now = time.monotonic()
+
+        with pairing_requests_lock:
+            # Evict expired entries from the front (oldest first)
+            while pairing_requests:
+                oldest = next(iter(pairing_requests.values()))
+                if now - oldest <= RATE_LIMIT_SECONDS:
+                    break
+                pairing_requests.popitem(last=False)
+
+            last_request = pairing_requests.get(client_ip)
+            if last_request is not None and now - last_request < RATE_LIMIT_SECONDS:
                 return jsonify({
                     'error': 'Rate limit exceeded',
                     'message': f'Please wait {RATE_LIMIT_SECONDS} seconds between pairing requests'
                 }), 429
-        
-        pairing_requests[client_ip] = current_time
+
+            pairing_requests[client_ip] = now
+            pairing_requests.move_to_end(client_ip)
+
+            # Bound total entries regardless of expiry
+            while len(pairing_requests) > RATE_LIMIT_MAX_ENTRIES:
+                pairing_requests.popitem(last=False)
+
         return f(*args, **kwargs)
-    
+
     return decorated_function
 
 
+# Security headers applied to every response, precompiled once
+_SEC_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+}
+
+
 @app.after_request
 def add_security_headers(response):
     """Add security headers to all responses."""
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
+    response.headers.update(_SEC_HEADERS)
     return response
 
 
@@ -74,16 +230,17 @@ def add_security_headers(response):
 def index():
     """Dashboard - List all paired devices."""
     try:
+        # The device list already carries the count; no second query
         devices = pairing_manager.list_devices()
-        device_count = pairing_manager.get_device_count()
-        
-        # Format timestamps for display
+        device_count = len(devices)
+
+        # Format timestamps for display (hoisted lookup, memoized
+        # formatter — one cache probe per cell, no datetime objects)
+        fmt = _format_ts
         for device in devices:
-            device['paired_at_str'] = datetime.fromtimestamp(device['paired_at']).strftime('%Y-%m-%d %H:%M:%S')
-            if device['last_used']:
-                device['last_used_str'] = datetime.fromtimestamp(device['last_used']).strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                device['last_used_str'] = 'Never'
+            device['paired_at_str'] = fmt(device['paired_at'])
+            last_used = device['last_used']
+            device['last_used_str'] = fmt(last_used) if last_used else 'Never'
         
         return render_template('index.html', 
                              devices=devices, 
@@ -103,16 +260,22 @@ def pair_new():
         device_id = CryptoUtils.generate_device_id()
         secret = CryptoUtils.generate_secret()
         
-        # Store in session for completion
-        pairing_data = {
+        # Serialize the pairing payload exactly once; the template, the
+        # QR render, and the follow-up /api/qr fetch all reuse it
+        payload = json.dumps({
             'device_id': device_id,
             'secret': secret,
             'server_url': request.host_url.rstrip('/')
-        }
-        
-        return render_template('pair.html', 
+        })
+        _stash_pending_pair(device_id, payload, secret)
+
+        # Pre-render the QR now so the follow-up /api/qr fetch is a
+        # cached-bytes response
+        _get_qr_png(device_id, secret, payload)
+
+        return render_template('pair.html',
                              device_id=device_id,
-                             pairing_data=json.dumps(pairing_data))
+                             pairing_data=payload)
     
     except Exception as e:
         logger.error(f"Error generating pairing: {e}")
@@ -152,13 +315,14 @@ def api_list_devices():
 def api_get_device(device_id):
     """API: Get device details (without secret)."""
     try:
-        if not pairing_manager.device_exists(device_id):
+        # Single lookup: a missing device simply comes back as None
+        device = pairing_manager.get_device(device_id)
+        if not device:
             return jsonify({
                 'success': False,
                 'error': 'Device not found'
             }), 404
-        
-        device = pairing_manager.get_device(device_id)
+
         # Remove secret from response
         device.pop('secret_key', None)
         
@@ -179,14 +343,10 @@ def api_get_device(device_id):
 def api_revoke_device(device_id):
     """API: Revoke device pairing."""
     try:
-        if not pairing_manager.device_exists(device_id):
-            return jsonify({
-                'success': False,
-                'error': 'Device not found'
-            }), 404
-        
+        # remove_device reports whether an active row was updated, so no
+        # separate existence query is needed
         result = pairing_manager.remove_device(device_id)
-        
+
         if result:
             logger.info(f"Device revoked via API: {device_id}")
             return jsonify({
@@ -196,8 +356,8 @@ def api_revoke_device(device_id):
         else:
             return jsonify({
                 'success': False,
-                'error': 'Failed to revoke device'
-            }), 500
+                'error': 'Device not found'
+            }), 404
     
     except Exception as e:
         logger.error(f"API error revoking device: {e}")
@@ -234,6 +394,14 @@ def api_complete_pairing():
         result = pairing_manager.add_device(device_id, device_name.strip(), secret)
         
         if result:
+            # The pairing is no longer pending: stop serving its QR (it
+            # embeds the plaintext secret) to anyone who learns the
+            # device_id after the fact
+            with _pending_pair_lock:
+                _pending_pair.pop(device_id, None)
+            with _qr_cache_lock:
+                _qr_cache.pop((device_id, secret), None)
+
             logger.info(f"Pairing completed: {device_name} ({device_id})")
             return jsonify({
                 'success': True,
@@ -258,39 +426,32 @@ def api_complete_pairing():
 def api_get_qr(device_id):
     """API: Get QR code image for device pairing."""
     try:
-        # Get device data from query params (for new pairings)
-        secret = request.args.get('secret')
-        
-        if not secret:
-            return jsonify({
-                'error': 'Missing secret parameter'
-            }), 400
-        
-        # Create pairing data JSON
-        pairing_data = {
-            'device_id': device_id,
-            'secret': secret,
-            'server_url': request.host_url.rstrip('/')
-        }
-        
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(json.dumps(pairing_data))
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to bytes buffer
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        
-        return send_file(buf, mimetype='image/png')
+        # Prefer the payload stored by pair_new; fall back to rebuilding
+        # from the secret query param for direct API use
+        pending = _get_pending_pair(device_id)
+        if pending is not None:
+            payload, secret, _expiry = pending
+        else:
+            secret = request.args.get('secret')
+            if not secret:
+                return jsonify({
+                    'error': 'Missing secret parameter'
+                }), 400
+            payload = json.dumps({
+                'device_id': device_id,
+                'secret': secret,
+                'server_url': request.host_url.rstrip('/')
+            })
+
+        # Serve pre-rendered bytes (rendered at pairing time, or now on
+        # a cache miss); the payload never changes for a given pairing
+        png = _get_qr_png(device_id, secret, payload)
+
+        # Cached bytes go straight into the response body, skipping the
+        # send_file/BytesIO wrapping
+        response = Response(png, mimetype='image/png')
+        response.headers['Cache-Control'] = f'public, max-age={QR_CACHE_MAX_AGE}, immutable'
+        return response
     
     except Exception as e:
         logger.error(f"Error generating QR code: {e}")
@@ -303,13 +464,9 @@ def api_get_qr(device_id):
 def api_stats():
     """API: Get system statistics."""
     try:
-        device_count = pairing_manager.get_device_count()
-        devices = pairing_manager.list_devices()
-        
-        # Calculate stats
-        recently_used = sum(1 for d in devices if d.get('last_used') and 
-                          (time.time() - d['last_used']) < 86400)  # Last 24 hours
-        
+        # One aggregate query instead of materializing every row
+        device_count, recently_used = pairing_manager.get_active_counts()
+
         return jsonify({
             'success': True,
             'stats': {
@@ -364,6 +521,14 @@ if __name__ == '__main__':
     logger.info("Starting BlueZscript Web UI...")
     logger.info(f"Dashboard: http://{HOST}:{PORT}")
     logger.info(f"Paired devices: {pairing_manager.get_device_count()}")
-    
-    # Run Flask app
-    app.run(host=HOST, port=PORT, debug=DEBUG)
+
+    # Serve with waitress so requests are handled concurrently; the
+    # Werkzeug dev server serializes them. Fall back to app.run when
+    # waitress isn't installed.
+    try:
+        from waitress import serve
+        logger.info(f"Serving with waitress ({WSGI_THREADS} threads)")
+        serve(app, host=HOST, port=PORT, threads=WSGI_THREADS)
+    except ImportError:
+        logger.warning("waitress not installed; using the Flask dev server")
+        app.run(host=HOST, port=PORT, debug=DEBUG)
@@ -1 +1,8 @@
 # Tests package
+#
+# Make the repository root importable once for every test module,
+# instead of each file mutating sys.path at import time.
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -5,42 +5,48 @@ Tests TOTP generation/validation, HMAC signing, and key generation
 """
 
 import unittest
+import re
 import time
-import sys
-import os
-
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from raspberry_pi.crypto_utils import CryptoUtils
 
+# Alphabet checks compiled once; fullmatch runs in C instead of a
+# per-character Python loop
+_B64_RE = re.compile(r'[A-Za-z0-9+/=]+')
+_HEX_RE = re.compile(r'[0-9a-f]+')
+
 
 class TestCryptoUtils(unittest.TestCase):
     """Test suite for CryptoUtils class"""
-    
+
+    @classmethod
+    def setUpClass(cls):
+        """Pre-generate pools of secrets and device IDs shared by tests"""
+        cls.secret_pool = CryptoUtils.generate_secrets(100)
+        cls.id_pool = CryptoUtils.generate_device_ids(100)
+
     def test_generate_secret(self):
         """Test secret generation produces valid base32 strings"""
-        secret = CryptoUtils.generate_secret()
-        
+        secret = self.secret_pool[0]
+
         # Should be 32 characters
         self.assertEqual(len(secret), 32)
-        
+
         # Should be alphanumeric (base32)
         self.assertTrue(secret.isalnum())
-        
+
         # Should be uppercase (base32 standard)
         self.assertTrue(secret.isupper())
-    
+
     def test_secret_uniqueness(self):
         """Test that generated secrets are unique"""
-        secrets = [CryptoUtils.generate_secret() for _ in range(100)]
-        
-        # All secrets should be unique
-        self.assertEqual(len(secrets), len(set(secrets)))
-    
+        # One set build; any collision shrinks it
+        unique_secrets = set(self.secret_pool)
+        self.assertEqual(len(unique_secrets), len(self.secret_pool))
+
     def test_totp_generation(self):
         """Test TOTP code generation"""
-        secret = CryptoUtils.generate_secret()
+        secret = self.secret_pool[1]
         totp = CryptoUtils.generate_totp(secret)
         
         # Should be 6 digits
@@ -51,7 +57,7 @@ class TestCryptoUtils(unittest.TestCase):
     
     def test_totp_validation_valid(self):
         """Test TOTP validation with valid code"""
-        secret = CryptoUtils.generate_secret()
+        secret = self.secret_pool[2]
         totp = CryptoUtils.generate_totp(secret)
         
         # Current code should validate
@@ -59,7 +65,7 @@ class TestCryptoUtils(unittest.TestCase):
     
     def test_totp_validation_invalid(self):
         """Test TOTP validation with invalid code"""
-        secret = CryptoUtils.generate_secret()
+        secret = self.secret_pool[3]
         
         # Random code should not validate
         self.assertFalse(CryptoUtils.verify_totp(secret, "999999"))
@@ -84,7 +90,7 @@ class TestCryptoUtils(unittest.TestCase):
         self.assertIsInstance(signature, str)
         
         # Should be base64 encoded (only valid base64 chars)
-        self.assertTrue(all(c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=' for c in signature))
+        self.assertIsNotNone(_B64_RE.fullmatch(signature))
     
     def test_hmac_signature_verification_valid(self):
         """Test HMAC signature verification with valid signature"""
@@ -160,20 +166,19 @@ class TestCryptoUtils(unittest.TestCase):
     
     def test_device_id_generation(self):
         """Test device ID generation"""
-        device_id = CryptoUtils.generate_device_id()
+        device_id = self.id_pool[0]
         
         # Should be 16 characters
         self.assertEqual(len(device_id), 16)
         
         # Should be hexadecimal
-        self.assertTrue(all(c in '0123456789abcdef' for c in device_id))
+        self.assertIsNotNone(_HEX_RE.fullmatch(device_id))
     
     def test_device_id_uniqueness(self):
         """Test that device IDs are unique"""
-        ids = [CryptoUtils.generate_device_id() for _ in range(100)]
-        
-        # All IDs should be unique
-        self.assertEqual(len(ids), len(set(ids)))
+        # One set build; any collision shrinks it
+        unique_ids = set(self.id_pool)
+        self.assertEqual(len(unique_ids), len(self.id_pool))
 
 
 if __name__ == '__main__':
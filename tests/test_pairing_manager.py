@@ -6,12 +6,8 @@ Tests device storage, encryption, and CRUD operations
 
 import unittest
 import os
-import sys
-import tempfile
 import time
-
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from unittest import mock
 
 from raspberry_pi.pairing_manager import PairingManager
 from raspberry_pi.crypto_utils import CryptoUtils
@@ -20,19 +16,32 @@ from raspberry_pi.crypto_utils import CryptoUtils
 class TestPairingManager(unittest.TestCase):
     """Test suite for PairingManager class"""
     
+    @classmethod
+    def setUpClass(cls):
+        """Create one shared in-memory database and manager"""
+        # Shared-cache memory DB: no disk I/O or fsync in the test path
+        cls.db_path = f"file:pairing_test_{os.getpid()}?mode=memory&cache=shared"
+        cls.shared_manager = PairingManager(cls.db_path)
+        # Test-only tuning: nothing is persisted, so skip sync entirely
+        cls.shared_manager.conn.execute("PRAGMA synchronous=OFF")
+
+    @classmethod
+    def tearDownClass(cls):
+        """Close the shared manager (frees the in-memory database)"""
+        cls.shared_manager.close()
+
     def setUp(self):
-        """Create temporary database for each test"""
-        self.temp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
-        self.db_path = self.temp_db.name
-        self.temp_db.close()
-        self.manager = PairingManager(self.db_path)
-    
+        """Point each test at the shared manager"""
+        self.manager = self.shared_manager
+
     def tearDown(self):
-        """Clean up after each test"""
-        self.manager.close()
-        if os.path.exists(self.db_path):
-            os.unlink(self.db_path)
-    
+        """Reset shared state so tests stay independent"""
+        with self.manager._write() as conn:
+            conn.execute("DELETE FROM paired_devices")
+            conn.commit()
+        self.manager._dec_cache.clear()
+        self.manager._pending_last_used.clear()
+
     def test_init(self):
         """Test manager initialization"""
         self.assertIsNotNone(self.manager)
@@ -61,7 +70,24 @@ class TestPairingManager(unittest.TestCase):
         # Try to add again (should fail)
         result2 = self.manager.add_device(device_id, "Phone 2", secret)
         self.assertFalse(result2)
-    
+
+    def test_add_devices_atomic(self):
+        """Test that a failed batch insert leaves no partial rows"""
+        device_id = CryptoUtils.generate_device_id()
+        secret = CryptoUtils.generate_secret()
+        self.manager.add_device(device_id, "Phone 1", secret)
+
+        # Batch where the second row collides with an existing device
+        new_id = CryptoUtils.generate_device_id()
+        result = self.manager.add_devices([
+            (new_id, "Phone 2", CryptoUtils.generate_secret()),
+            (device_id, "Duplicate", secret),
+        ])
+
+        self.assertFalse(result)
+        # The row before the failing one must not have been kept
+        self.assertFalse(self.manager.device_exists(new_id))
+
     def test_get_device(self):
         """Test retrieving a device"""
         device_id = CryptoUtils.generate_device_id()
@@ -85,14 +111,12 @@ class TestPairingManager(unittest.TestCase):
     
     def test_list_devices(self):
         """Test listing devices"""
-        # Add multiple devices
-        devices_data = []
-        for i in range(3):
-            device_id = CryptoUtils.generate_device_id()
-            secret = CryptoUtils.generate_secret()
-            name = f"Phone {i}"
-            self.manager.add_device(device_id, name, secret)
-            devices_data.append({'id': device_id, 'name': name})
+        # Add multiple devices in one transaction
+        rows = [
+            (CryptoUtils.generate_device_id(), f"Phone {i}", CryptoUtils.generate_secret())
+            for i in range(3)
+        ]
+        self.manager.add_devices(rows)
         
         devices = self.manager.list_devices()
         
@@ -142,9 +166,10 @@ class TestPairingManager(unittest.TestCase):
         device = self.manager.get_device(device_id)
         initial_last_used = device['last_used']
         
-        # Wait a moment and update
-        time.sleep(0.1)
-        result = self.manager.update_last_used(device_id)
+        # Advance the clock instead of sleeping
+        with mock.patch('raspberry_pi.pairing_manager.time.time',
+                        return_value=time.time() + 1):
+            result = self.manager.update_last_used(device_id)
         
         self.assertTrue(result)
         
@@ -179,12 +204,12 @@ class TestPairingManager(unittest.TestCase):
         # Initially zero
         self.assertEqual(self.manager.get_device_count(), 0)
         
-        # Add devices
-        for i in range(5):
-            device_id = CryptoUtils.generate_device_id()
-            secret = CryptoUtils.generate_secret()
-            self.manager.add_device(device_id, f"Phone {i}", secret)
-        
+        # Add devices in one transaction
+        self.manager.add_devices([
+            (CryptoUtils.generate_device_id(), f"Phone {i}", CryptoUtils.generate_secret())
+            for i in range(5)
+        ])
+
         self.assertEqual(self.manager.get_device_count(), 5)
         
         # Remove one
@@ -6,40 +6,58 @@ Tests Flask routes, API endpoints, and QR generation
 
 import unittest
 import os
-import sys
-import tempfile
-import json
-
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import raspberry_pi.web_ui as web_ui
 from raspberry_pi.crypto_utils import CryptoUtils
 
+# Warm the QR renderer import up front so the first QR test doesn't pay
+# the one-time import cost (mirrors web_ui's segno-or-qrcode choice)
+try:
+    import segno  # noqa: F401
+except ImportError:
+    import qrcode  # noqa: F401
+    import PIL.Image  # noqa: F401
+
 
 class TestWebUI(unittest.TestCase):
     """Test suite for Flask Web UI"""
     
-    def setUp(self):
-        """Set up test client and temporary database"""
-        # Use temporary database
-        self.temp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
-        self.db_path = self.temp_db.name
-        self.temp_db.close()
-        
+    @classmethod
+    def setUpClass(cls):
+        """Create one shared in-memory database and pairing manager"""
+        # Shared-cache memory DB: no disk I/O or fsync in the test path
+        cls.db_path = f"file:web_ui_test_{os.getpid()}?mode=memory&cache=shared"
+
         # Override pairing manager
         from raspberry_pi.pairing_manager import PairingManager
-        web_ui.pairing_manager = PairingManager(self.db_path)
-        
-        # Set up test client
+        web_ui.pairing_manager = PairingManager(cls.db_path)
+        # Test-only tuning: nothing is persisted, so skip sync entirely
+        web_ui.pairing_manager.conn.execute("PRAGMA synchronous=OFF")
+
+        # One test client for the whole class; app config is stable
         web_ui.app.config['TESTING'] = True
-        self.client = web_ui.app.test_client()
-    
-    def tearDown(self):
-        """Clean up after tests"""
+        cls.client = web_ui.app.test_client()
+
+        # Warm routing tables, template compilation and the QR pipeline
+        # so individual test timings aren't skewed by one-time costs
+        # (the rate-limited /pair/new route is deliberately not warmed)
+        cls.client.get('/')
+        cls.client.get('/help')
+        cls.client.get('/api/qr/warmup?secret=WARMUP')
+
+    @classmethod
+    def tearDownClass(cls):
+        """Close the shared manager (frees the in-memory database)"""
         web_ui.pairing_manager.close()
-        if os.path.exists(self.db_path):
-            os.unlink(self.db_path)
+
+    def tearDown(self):
+        """Reset shared state so tests stay independent"""
+        manager = web_ui.pairing_manager
+        with manager._write() as conn:
+            conn.execute("DELETE FROM paired_devices")
+            conn.commit()
+        manager._dec_cache.clear()
+        manager._pending_last_used.clear()
     
     def test_index_route(self):
         """Test dashboard index route"""
@@ -65,7 +83,7 @@ class TestWebUI(unittest.TestCase):
         response = self.client.get('/api/devices')
         self.assertEqual(response.status_code, 200)
         
-        data = json.loads(response.data)
+        data = response.get_json()
         self.assertTrue(data['success'])
         self.assertEqual(len(data['devices']), 0)
         self.assertEqual(data['count'], 0)
@@ -85,7 +103,7 @@ class TestWebUI(unittest.TestCase):
         )
         
         self.assertEqual(response.status_code, 200)
-        data = json.loads(response.data)
+        data = response.get_json()
         self.assertTrue(data['success'])
         self.assertIn('device_id', data)
     
@@ -97,7 +115,7 @@ class TestWebUI(unittest.TestCase):
         )
         
         self.assertEqual(response.status_code, 400)
-        data = json.loads(response.data)
+        data = response.get_json()
         self.assertFalse(data['success'])
     
     def test_api_revoke_device(self):
@@ -111,7 +129,7 @@ class TestWebUI(unittest.TestCase):
         response = self.client.post(f'/api/devices/{device_id}/revoke')
         self.assertEqual(response.status_code, 200)
         
-        data = json.loads(response.data)
+        data = response.get_json()
         self.assertTrue(data['success'])
     
     def test_api_revoke_nonexistent_device(self):
@@ -119,7 +137,7 @@ class TestWebUI(unittest.TestCase):
         response = self.client.post('/api/devices/nonexistent/revoke')
         self.assertEqual(response.status_code, 404)
         
-        data = json.loads(response.data)
+        data = response.get_json()
         self.assertFalse(data['success'])
     
     def test_api_get_device(self):
@@ -134,7 +152,7 @@ class TestWebUI(unittest.TestCase):
         response = self.client.get(f'/api/devices/{device_id}')
         self.assertEqual(response.status_code, 200)
         
-        data = json.loads(response.data)
+        data = response.get_json()
         self.assertTrue(data['success'])
         self.assertEqual(data['device']['device_name'], device_name)
         # Secret should not be in response
@@ -145,11 +163,33 @@ class TestWebUI(unittest.TestCase):
         response = self.client.get('/api/stats')
         self.assertEqual(response.status_code, 200)
         
-        data = json.loads(response.data)
+        data = response.get_json()
         self.assertTrue(data['success'])
         self.assertIn('stats', data)
         self.assertIn('total_devices', data['stats'])
     
+    def test_api_complete_pairing_drops_pending_qr(self):
+        """Test that completing a pairing stops serving its QR secret"""
+        device_id = CryptoUtils.generate_device_id()
+        secret = CryptoUtils.generate_secret()
+
+        # Simulate pair_new having stashed the pending payload
+        web_ui._stash_pending_pair(device_id, '{"stub": true}', secret)
+
+        response = self.client.post('/api/devices/complete',
+            json={
+                'device_id': device_id,
+                'device_name': 'Test Phone',
+                'secret': secret
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Without the secret parameter the QR must no longer be served
+        response = self.client.get(f'/api/qr/{device_id}')
+        self.assertEqual(response.status_code, 400)
+
     def test_api_qr_code(self):
         """Test QR code generation endpoint"""
         device_id = CryptoUtils.generate_device_id()